@@ -1 +1,3 @@
+from spurl.core import SpurlSpec, build_url  # noqa: F401
+
 __version__ = "0.6.7"
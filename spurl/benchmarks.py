@@ -0,0 +1,316 @@
+"""Benchmarks for the spurl template tag and URL builder.
+
+Run them with ``python -m spurl.benchmarks`` or, from a project with spurl
+in ``INSTALLED_APPS``, with ``manage.py spurl_benchmark``. Nothing touches
+the network. Each benchmark reports the number of URLs built per second,
+the latency of each call at a few percentiles and the memory allocated
+per call, as traced by ``tracemalloc``.
+
+Results can be saved as a baseline with ``--save`` and compared against
+later with ``--compare``, which exits with a non-zero status if any
+benchmark has slowed down by more than ``--threshold`` percent.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+DEFAULT_THRESHOLD = 10.0
+WARMUP_CALLS = 10
+TRACED_CALLS = 20
+
+# setup is called once, and returns the function being timed. Each call
+# of that function builds `urls` URLs
+Benchmark = namedtuple("Benchmark", ["name", "setup", "number", "urls"])
+
+BenchmarkResult = namedtuple(
+    "BenchmarkResult", ["name", "calls", "urls", "urls_per_second", "p50", "p90", "p99", "peak_kib"]
+)
+
+LARGE_QUERY = "&".join("param%d=value%d" % (i, i) for i in range(200))
+
+
+def template_benchmark(template_string, context=None):
+    """Return a setup function which compiles template_string with the
+    spurl tags loaded, and times rendering it with the given context"""
+
+    def setup():
+        from django.template import Context, Engine
+
+        engine = Engine(builtins=["spurl.templatetags.spurl"])
+        template = engine.from_string(template_string)
+        render_context = Context(context() if callable(context) else context, autoescape=True)
+        return lambda: template.render(render_context)
+
+    return setup
+
+
+def build_url_benchmark(**kwargs):
+    def setup():
+        from spurl.core import build_url
+
+        return lambda: build_url(**kwargs)
+
+    return setup
+
+
+def loop_benchmark(size):
+    return Benchmark(
+        "loop_%dk" % (size // 1000),
+        template_benchmark(
+            "{% for page in pages %}{% spurl base=url set_query=page %}{% endfor %}",
+            lambda: {"url": "http://example.com/list/?sort=name", "pages": ["page=%d" % i for i in range(size)]},
+        ),
+        max(1, 100000 // size),
+        size,
+    )
+
+
+BENCHMARKS = [
+    Benchmark(
+        "literal",
+        template_benchmark('{% spurl base="http://example.com/a/?b=c" secure="true" add_path="d" %}'),
+        20000,
+        1,
+    ),
+    Benchmark(
+        "variables",
+        template_benchmark(
+            "{% spurl base=url secure=secure add_query=query fragment=fragment %}",
+            {"url": "http://example.com/a/?b=c", "secure": True, "query": "d=e", "fragment": "top"},
+        ),
+        20000,
+        1,
+    ),
+    Benchmark(
+        "nested_template",
+        template_benchmark(
+            '{% spurl base=url add_query="page={{ page }}" add_path="{{ section|lower }}" %}',
+            {"url": "http://example.com/a/", "page": 2, "section": "News"},
+        ),
+        10000,
+        1,
+    ),
+    Benchmark(
+        "large_query",
+        template_benchmark(
+            '{% spurl base=url set_query="param100=x" remove_query_param="param5" toggle_query="param7=a,b" %}',
+            {"url": "http://example.com/search/?" + LARGE_QUERY},
+        ),
+        2000,
+        1,
+    ),
+    Benchmark(
+        "escape_path",
+        template_benchmark("{% spurl base=url add_path=section %}", {"url": "http://example.com/a/", "section": "b"}),
+        20000,
+        1,
+    ),
+    Benchmark(
+        "escape_query",
+        template_benchmark(
+            "{% spurl base=url set_query=query as next_url %}{{ next_url }}",
+            {"url": "http://example.com/search/?" + LARGE_QUERY[:400], "query": "page=2"},
+        ),
+        10000,
+        1,
+    ),
+    Benchmark(
+        "from_chain",
+        template_benchmark(
+            "{% spurl base=url scheme_from=other host_from=other path_from=other "
+            "query_from=other fragment_from=other port_from=other %}",
+            {"url": "http://example.com/", "other": "https://www.example.org:8000/a/b/?c=d#e"},
+        ),
+        10000,
+        1,
+    ),
+    Benchmark(
+        "build_url",
+        build_url_benchmark(base="http://example.com/a/?b=c", secure=True, set_query={"page": 2}),
+        20000,
+        1,
+    ),
+    loop_benchmark(1000),
+    loop_benchmark(10000),
+    loop_benchmark(100000),
+]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def traced_peak(function):
+    """Call function, returning the peak memory, in bytes, allocated
+    while it ran. Tracing is started afresh for each call, rather than
+    using tracemalloc.reset_peak(), which needs Python 3.9"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(benchmark, scale=1.0):
+    """Run a single benchmark, returning a BenchmarkResult. Latencies
+    are in microseconds per call"""
+    function = benchmark.setup()
+    for i in range(min(WARMUP_CALLS, benchmark.number)):
+        function()
+
+    calls = max(1, int(benchmark.number * scale))
+    timings = []
+    clock = time.perf_counter
+    for i in range(calls):
+        start = clock()
+        function()
+        timings.append(clock() - start)
+    timings.sort()
+    total = sum(timings)
+
+    # Tracing slows everything down, so measure memory separately
+    traced_calls = min(TRACED_CALLS, calls)
+    peak = 0
+    for i in range(traced_calls):
+        peak += traced_peak(function)
+
+    return BenchmarkResult(
+        name=benchmark.name,
+        calls=calls,
+        urls=benchmark.urls,
+        urls_per_second=calls * benchmark.urls / total if total else 0.0,
+        p50=percentile(timings, 0.5) * 1e6,
+        p90=percentile(timings, 0.9) * 1e6,
+        p99=percentile(timings, 0.99) * 1e6,
+        peak_kib=peak / traced_calls / 1024,
+    )
+
+
+def run(names=None, scale=1.0, benchmarks=None):
+    """Run the benchmarks (all of them, or just those named), yielding
+    a BenchmarkResult for each as it finishes"""
+    for benchmark in benchmarks or BENCHMARKS:
+        if names and benchmark.name not in names:
+            continue
+        yield run_benchmark(benchmark, scale)
+
+
+def environment():
+    import django
+
+    import spurl
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "django": django.get_version(),
+        "spurl": spurl.__version__,
+    }
+
+
+def save_results(results, path):
+    data = {"environment": environment(), "results": {result.name: result._asdict() for result in results}}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {name: BenchmarkResult(**result) for name, result in data["results"].items()}
+
+
+def compare(result, baseline):
+    """Return the percentage change in throughput from baseline to
+    result. Negative numbers are slowdowns"""
+    if not baseline.urls_per_second:
+        return 0.0
+    return (result.urls_per_second / baseline.urls_per_second - 1) * 100
+
+
+def format_result(result, baseline=None):
+    line = "%-16s %12.0f %10.1f %10.1f %10.1f %10.1f" % (
+        result.name,
+        result.urls_per_second,
+        result.p50,
+        result.p90,
+        result.p99,
+        result.peak_kib,
+    )
+    if baseline is not None:
+        line += " %+9.1f%%" % compare(result, baseline)
+    return line
+
+
+def format_header(baselines=None):
+    header = "%-16s %12s %10s %10s %10s %10s" % ("benchmark", "urls/s", "p50 us", "p90 us", "p99 us", "peak KiB")
+    if baselines is not None:
+        header += " %10s" % "vs base"
+    return header
+
+
+def add_arguments(parser):
+    parser.add_argument("names", nargs="*", help="Only run the named benchmarks")
+    parser.add_argument("--list", action="store_true", help="List the available benchmarks and exit")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiply the number of calls made by each benchmark by this"
+    )
+    parser.add_argument("--save", metavar="PATH", help="Save the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare the results with a saved baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Slowdown, in percent, beyond which a comparison fails (default: %(default)s)",
+    )
+
+
+def main(options, stdout=sys.stdout):
+    """Run the benchmarks for parsed command line options, writing a
+    report to stdout. Returns the number of regressions found"""
+    if options.list:
+        for benchmark in BENCHMARKS:
+            stdout.write("%s\n" % benchmark.name)
+        return 0
+
+    unknown = set(options.names) - {benchmark.name for benchmark in BENCHMARKS}
+    if unknown:
+        raise ValueError("Unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+
+    baselines = load_results(options.compare) if options.compare else None
+    stdout.write(format_header(baselines) + "\n")
+
+    results, regressions = [], 0
+    for result in run(options.names, options.scale):
+        results.append(result)
+        baseline = baselines.get(result.name) if baselines is not None else None
+        stdout.write(format_result(result, baseline) + "\n")
+        stdout.flush()
+        if baseline is not None and compare(result, baseline) < -options.threshold:
+            regressions += 1
+
+    if options.save:
+        save_results(results, options.save)
+    if regressions:
+        stdout.write("%d benchmark(s) slower than the baseline by more than %s%%\n" % (regressions, options.threshold))
+    return regressions
+
+
+if __name__ == "__main__":
+    import django
+    from django.conf import settings
+
+    if not settings.configured:
+        settings.configure(TEMPLATES=[{"BACKEND": "django.template.backends.django.DjangoTemplates"}])
+        django.setup()
+
+    parser = argparse.ArgumentParser(prog="python -m spurl.benchmarks", description=__doc__.split("\n\n")[0])
+    add_arguments(parser)
+    sys.exit(1 if main(parser.parse_args()) else 0)
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from spurl.url import ParsedURL
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+
+class LRUCache:
+    """A thread-safe, size-bounded mapping which discards the least
+    recently used entries first. maxsize may be an integer or a callable
+    returning one, so that it can follow a Django setting. A maxsize of
+    zero (or less) disables caching altogether."""
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def maxsize(self):
+        if callable(self._maxsize):
+            return self._maxsize()
+        return self._maxsize
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        maxsize = self.maxsize
+        if maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+
+URL_KEY_PREFIX = "spurl.url"
+
+# Values which are keyed by their repr. Anything else (model instances,
+# say) may not have a repr which identifies it, so isn't keyed at all
+KEYABLE_TYPES = (str, int, float, type(None))
+
+
+def key_fragment(value):
+    """Return a stable, hashable stand-in for a resolved argument value,
+    or raise TypeError if there isn't one"""
+    if isinstance(value, KEYABLE_TYPES):
+        return value
+    if isinstance(value, ParsedURL):
+        return value.url
+    if isinstance(value, dict):
+        return ("dict", tuple((key_fragment(k), key_fragment(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(key_fragment(v) for v in value))
+    raise TypeError("Can't derive a cache key from %r" % type(value))
+
+
+def make_url_key(names, values, autoescape):
+    """Make a key for Django's cache framework from exactly the inputs
+    that determine a URL: the argument names, their resolved values and
+    whether the URL is escaped. Returns None if any value can't be keyed"""
+    try:
+        fragments = tuple(key_fragment(value) for value in values)
+    except TypeError:
+        return None
+    digest = hashlib.md5(repr((tuple(names), fragments, bool(autoescape))).encode("utf-8")).hexdigest()
+    return "%s.%s" % (URL_KEY_PREFIX, digest)
@@ -0,0 +1,8 @@
+from spurl.url import get_parsed_url
+
+
+def current_url(request):
+    """Add the request's full path, parsed once per request, to the
+    context as current_url. Use it wherever you would use
+    request.get_full_path: {% spurl base=current_url set_query="page=2" %}"""
+    return {"current_url": get_parsed_url(request)}
@@ -0,0 +1,482 @@
+import re
+import threading
+from time import perf_counter
+from urllib.parse import unquote, urlsplit
+from weakref import WeakKeyDictionary
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import get_resolver, get_script_prefix, get_urlconf, reverse
+from django.utils.html import escape
+from django.utils.safestring import SafeString
+from django.utils.translation import get_language
+from urlobject.query_string import QueryString
+
+from spurl import instrumentation
+from spurl.cache import LRUCache
+from spurl.url import MutableURL, ParsedURL
+
+TRUE_RE = re.compile(r"^(true|on)$", flags=re.IGNORECASE)
+
+DEFAULT_REVERSE_CACHE_SIZE = 1024
+
+DEFAULT_STATIC_CACHE_SIZE = 1024
+
+# Results of reverse(), in an LRU cache per URL resolver. clear_url_caches()
+# replaces the resolvers, so it discards these caches along with them
+reverse_caches = WeakKeyDictionary()
+reverse_caches_lock = threading.Lock()
+
+
+def escape_url(url):
+    """Escape a URL for HTML with Django's escape(), skipping it
+    altogether when the URL contains none of the characters it escapes"""
+    if "&" in url or "<" in url or ">" in url or '"' in url or "'" in url:
+        return escape(url)
+    return SafeString(url)
+
+
+def reverse_context():
+    """The state, besides its arguments, that the result of reverse()
+    depends on: the urlconf, script prefix and language in effect"""
+    return get_urlconf(), get_script_prefix(), get_language()
+
+
+def cached_reverse(viewname, args=None, kwargs=None):
+    """reverse() a URL, remembering the result for the current urlconf,
+    script prefix and language. The cache is bounded by
+    SPURL_REVERSE_CACHE_SIZE"""
+    args = tuple(args or ())
+    kwargs = kwargs or {}
+    # Equal values of different types, like True and 1, may reverse to
+    # different URLs
+    key = (
+        viewname,
+        tuple((type(value), value) for value in args),
+        tuple((name, type(value), value) for name, value in sorted(kwargs.items())),
+    ) + reverse_context()
+    try:
+        hash(key)
+    except TypeError:
+        return reverse(viewname, args=args, kwargs=kwargs)
+
+    resolver = get_resolver(key[3])
+    cache = reverse_caches.get(resolver)
+    if cache is None:
+        with reverse_caches_lock:
+            cache = reverse_caches.get(resolver)
+            if cache is None:
+                cache = reverse_caches[resolver] = LRUCache(
+                    lambda: getattr(settings, "SPURL_REVERSE_CACHE_SIZE", DEFAULT_REVERSE_CACHE_SIZE)
+                )
+    url = cache.get(key)
+    if url is None:
+        url = reverse(viewname, args=args, kwargs=kwargs)
+        cache.set(key, url)
+    return url
+
+
+# URLs of static files, as given by the staticfiles storage, by name
+static_cache = LRUCache(lambda: getattr(settings, "SPURL_STATIC_CACHE_SIZE", DEFAULT_STATIC_CACHE_SIZE))
+
+
+def static_url(name):
+    """Return staticfiles_storage.url(name), remembering the result. With
+    a manifest storage, this saves looking up the hashed name each time"""
+    url = static_cache.get(name)
+    if url is None:
+        from django.contrib.staticfiles.storage import staticfiles_storage
+
+        url = staticfiles_storage.url(name)
+        static_cache.set(name, url)
+    return url
+
+
+@receiver(setting_changed)
+def reset_static_cache(setting, **kwargs):
+    if setting in ("STATIC_URL", "STATIC_ROOT", "STORAGES", "STATICFILES_STORAGE"):
+        static_cache.clear()
+
+
+def convert_to_boolean(string_or_boolean):
+    if isinstance(string_or_boolean, bool):
+        return string_or_boolean
+    if isinstance(string_or_boolean, str):
+        return bool(TRUE_RE.match(string_or_boolean))
+
+
+class URLBuilder:
+    """Builds a URL from spurl's arguments, given as a dispatch list of
+    (handler, value) pairs. The values are used as they are; subclasses
+    can change how they are resolved and prepared, as the template tag's
+    builder does"""
+
+    unknown_argument_error = TypeError
+
+    # Arguments whose effect depends on more than their values (the
+    # request's urlconf, say), so can't be applied ahead of time
+    request_dependent_arguments = frozenset(["url_name", "url_args", "url_kwargs", "static", "static_from"])
+
+    # Handlers which read or replace the path, before which any pending
+    # url_name is reversed (see apply_reverse)
+    path_handler_names = frozenset(
+        [
+            "handle_base",
+            "handle_static",
+            "handle_static_from",
+            "handle_path",
+            "handle_path_from",
+            "handle_add_path",
+            "handle_add_path_from",
+        ]
+    )
+
+    def __init__(self, dispatch=None, autoescape=False):
+        self.dispatch = dispatch or []
+        self.autoescape = autoescape
+        # [url_name, url_args, url_kwargs], until they are reversed
+        self.pending_reverse = None
+        # None means follow SPURL_CANONICAL_URLS
+        self.canonical = None
+        self.url = MutableURL()
+        self.parsed_urls = None
+
+    @classmethod
+    def get_handler(cls, argument):
+        """Return the (unbound) handler method for an argument
+        name, or None if spurl doesn't understand it"""
+        if argument == "argument":
+            return None
+        return getattr(cls, "handle_%s" % argument, None)
+
+    @classmethod
+    def compile_arguments(cls, args, strict=False):
+        """Resolve a list of (argument name, value) pairs to a list of
+        (handler, value) pairs. Unknown arguments are dropped, or raise
+        unknown_argument_error if strict is True"""
+        dispatch = []
+        for argument, value in args:
+            handler = cls.get_handler(argument)
+            if handler is None:
+                if strict:
+                    raise cls.unknown_argument_error("Unknown argument to spurl: '%s'" % argument)
+                continue
+            dispatch.append((handler, value))
+        return dispatch
+
+    def resolve_value(self, value):
+        return value
+
+    def resolve_values(self, dispatch=None):
+        if dispatch is None:
+            dispatch = self.dispatch
+        return [self.resolve_value(value) for handler, value in dispatch]
+
+    def apply(self, dispatch, values):
+        """Run the handlers in a dispatch list with their resolved values"""
+        if instrumentation.enabled is not False and instrumentation.is_enabled():
+            return instrumentation.apply(self, dispatch, values)
+        for (handler, _), value in zip(dispatch, values):
+            if self.pending_reverse is not None and handler.__name__ in self.path_handler_names:
+                self.apply_reverse()
+            handler(self, value)
+
+    def build(self, values=None):
+        """Build the URL. If the argument values have already been
+        resolved, they can be passed in"""
+        if instrumentation.enabled is not False and instrumentation.is_enabled():
+            start = perf_counter()
+        else:
+            start = None
+        if values is None:
+            values = self.resolve_values()
+        self.apply(self.dispatch, values)
+        url = self.finish()
+        if start is not None:
+            instrumentation.url_built(self, url, perf_counter() - start)
+        return url
+
+    def finish(self):
+        """Serialise the URL built so far"""
+        if self.pending_reverse is not None:
+            self.apply_reverse()
+        self.set_sensible_defaults()
+
+        url = str(self.url)
+
+        if self.autoescape:
+            url = escape_url(url)
+
+        return url
+
+    def handle_base(self, value):
+        base = self.prepare_value(value)
+        self.url = MutableURL(base)
+
+    def handle_static(self, value):
+        name = self.prepare_value(value)
+        self.url = MutableURL(static_url(name))
+
+    def handle_static_from(self, value):
+        url = self.parse_url(value)
+        # Take the name of the file relative to STATIC_URL, if it is there
+        name = unquote(url.path)
+        static_path = urlsplit(settings.STATIC_URL or "").path
+        if static_path and name.startswith(static_path):
+            name = name[len(static_path) :]
+        self.url = MutableURL(static_url(name.lstrip("/")))
+
+    def handle_auth(self, value):
+        auth = self.prepare_value(value)
+        self.url.set_auth(*auth.split(":", 1))
+
+    def handle_secure(self, value):
+        is_secure = convert_to_boolean(value)
+        scheme = "https" if is_secure else "http"
+        self.url.set_scheme(scheme)
+
+    def handle_query(self, value):
+        query = self.prepare_value(value)
+        if isinstance(query, dict):
+            self.url.set_query("")
+            self.url.set_query_params(query.items())
+        else:
+            self.url.set_query(query)
+
+    def handle_query_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_query(url.query)
+
+    def handle_add_query(self, value):
+        query_to_add = self.prepare_value(value)
+        if isinstance(query_to_add, str):
+            query_to_add = QueryString(query_to_add).dict
+        self.url.add_query_params(query_to_add.items())
+
+    def handle_add_query_from(self, value):
+        url = self.parse_url(value)
+        self.url.add_query_params(url.query_dict.items())
+
+    def handle_set_query(self, value):
+        query_to_set = self.prepare_value(value)
+        if isinstance(query_to_set, str):
+            query_to_set = QueryString(query_to_set).dict
+        self.url.set_query_params(query_to_set.items())
+
+    def handle_set_query_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_query_params(url.query_dict.items())
+
+    def handle_remove_query_param(self, value):
+        query_to_remove = self.prepare_value(value)
+        if "=" in query_to_remove:
+            k, v = query_to_remove.split("=", 1)
+            self.url.del_query_param_value(k, v)
+        else:
+            self.url.del_query_param(query_to_remove)
+
+    def handle_remove_query_params_except(self, value):
+        params_to_keep = set(self.prepare_value(value).split(" "))
+        self.url.set_query_list([pair for pair in self.url.query_list if pair[0] in params_to_keep])
+
+    def handle_toggle_query(self, value):
+        query_to_toggle = self.prepare_value(value)
+        if isinstance(query_to_toggle, str):
+            query_to_toggle = QueryString(query_to_toggle).dict
+        current_query = self.url.query_dict
+        toggled = []
+        for key, value in query_to_toggle.items():
+            if isinstance(value, str):
+                value = value.split(",")
+            first, second = value
+            if key in current_query and first == current_query[key]:
+                toggled.append((key, second))
+            else:
+                toggled.append((key, first))
+        # Set every toggled parameter in one go, rather than rebuilding
+        # the query once per parameter
+        self.url.set_query_params(toggled)
+
+    def handle_scheme(self, value):
+        self.url.set_scheme(value)
+
+    def handle_scheme_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_scheme(url.scheme)
+
+    def handle_host(self, value):
+        host = self.prepare_value(value)
+        self.url.set_hostname(host)
+
+    def handle_host_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_hostname(url.hostname)
+
+    def handle_path(self, value):
+        path = self.prepare_value(value)
+        self.url.set_path(path)
+
+    def handle_url_name(self, value):
+        self.get_pending_reverse()[0] = value
+
+    def handle_url_args(self, value):
+        if isinstance(value, str) or not hasattr(value, "__iter__"):
+            value = [value]
+        self.get_pending_reverse()[1] = value
+
+    def handle_url_kwargs(self, value):
+        self.get_pending_reverse()[2] = value
+
+    def get_pending_reverse(self):
+        if self.pending_reverse is None:
+            self.pending_reverse = [None, None, None]
+        return self.pending_reverse
+
+    def apply_reverse(self):
+        """Reverse the URL named by the url_name, url_args and url_kwargs
+        arguments given so far, and set it as the path. This happens when
+        the next argument which works on the path is applied, or when the
+        URL is built, so url_args and url_kwargs can come later"""
+        viewname, args, kwargs = self.pending_reverse
+        self.pending_reverse = None
+        if viewname is None:
+            raise ValueError("url_args and url_kwargs need a url_name")
+        self.url.set_path(cached_reverse(viewname, args, kwargs))
+
+    def handle_path_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_path(url.path)
+
+    def handle_add_path(self, value):
+        path_to_add = self.prepare_value(value)
+        self.url.add_path(path_to_add)
+
+    def handle_add_path_from(self, value):
+        url = self.parse_url(value)
+        path_to_add = url.path
+        if path_to_add.startswith("/"):
+            path_to_add = path_to_add[1:]
+        self.url.add_path(path_to_add)
+
+    def handle_fragment(self, value):
+        fragment = self.prepare_value(value)
+        self.url.set_fragment(fragment)
+
+    def handle_fragment_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_fragment(url.fragment)
+
+    def handle_port(self, value):
+        self.url.set_port(int(value))
+
+    def handle_port_from(self, value):
+        url = self.parse_url(value)
+        self.url.set_port(url.port)
+
+    def parse_url(self, value):
+        """Parse a URL passed to one of the *_from arguments. Each distinct
+        URL is only parsed once per builder, and ParsedURLs not at all"""
+        if isinstance(value, ParsedURL):
+            return value
+        url = str(value)
+        if self.parsed_urls is None:
+            self.parsed_urls = {}
+        parsed = self.parsed_urls.get(url)
+        if parsed is None:
+            parsed = self.parsed_urls[url] = ParsedURL(url)
+        return parsed
+
+    def handle_autoescape(self, value):
+        self.autoescape = convert_to_boolean(value)
+
+    def handle_canonical(self, value):
+        self.canonical = convert_to_boolean(value)
+
+    def set_sensible_defaults(self):
+        if self.url.hostname and not self.url.scheme:
+            self.url.set_scheme("http")
+        canonical = self.canonical
+        if canonical is None:
+            canonical = getattr(settings, "SPURL_CANONICAL_URLS", False)
+        if canonical:
+            self.url.canonicalize()
+
+    def prepare_value(self, value):
+        return value
+
+
+class SpurlSpec:
+    """A reusable set of spurl arguments, for building URLs outside of
+    templates. Arguments are given as keyword arguments or, where one needs
+    repeating, as an iterable of (name, value) pairs. Either way, they are
+    applied in order, pairs first:
+
+    >>> spec = SpurlSpec([("base", "http://example.com"), ("add_path", "a"), ("add_path", "b")])
+    >>> spec.build(query="page=2")
+    'http://example.com/a/b?page=2'
+
+    The arguments are applied once, when the spec is created. Each call to
+    build() starts from a copy of the result and applies any further
+    arguments it is given. Values are used as they are: unlike in the
+    template tag, they are never rendered as templates.
+    """
+
+    builder_class = URLBuilder
+
+    def __init__(self, *args, **kwargs):
+        self.args = get_argument_list(args, kwargs)
+        builder = self.builder_class(self.builder_class.compile_arguments(self.args, strict=True))
+        builder.apply(builder.dispatch, builder.resolve_values())
+        self.url, self.autoescape, self.canonical = builder.url, builder.autoescape, builder.canonical
+        self.pending_reverse = builder.pending_reverse
+
+    def build(self, *args, **kwargs):
+        return self.get_builder(
+            self.builder_class.compile_arguments(get_argument_list(args, kwargs), strict=True)
+        ).build()
+
+    def build_many(self, argument_lists):
+        """Lazily build a URL for each item of an iterable, each a dict or
+        an iterable of (name, value) pairs of further arguments. Argument
+        names are only looked up once for each distinct list of them, so
+        this is quicker than calling build() for each"""
+        handler_lists = {}
+        for arguments in argument_lists:
+            if isinstance(arguments, dict):
+                arguments = arguments.items()
+            arguments = list(arguments)
+            names = tuple(name for name, value in arguments)
+            handlers = handler_lists.get(names)
+            if handlers is None:
+                dispatch = self.builder_class.compile_arguments(arguments, strict=True)
+                handlers = handler_lists[names] = [handler for handler, value in dispatch]
+            dispatch = [(handler, value) for handler, (name, value) in zip(handlers, arguments)]
+            yield self.get_builder(dispatch).build()
+
+    def get_builder(self, dispatch):
+        """Return a builder for a dispatch list, starting from the spec's URL"""
+        builder = self.builder_class(dispatch)
+        builder.url, builder.autoescape, builder.canonical = self.url.copy(), self.autoescape, self.canonical
+        if self.pending_reverse is not None:
+            builder.pending_reverse = list(self.pending_reverse)
+        return builder
+
+
+def get_argument_list(args, kwargs):
+    if len(args) > 1:
+        raise TypeError("Expected at most 1 positional argument, got %d" % len(args))
+    arguments = list(args[0]) if args else []
+    arguments.extend(kwargs.items())
+    return arguments
+
+
+def build_url(*args, **kwargs):
+    """Build a URL from spurl's arguments, with the same semantics as
+    the template tag:
+
+    >>> build_url(base="http://example.com/?a=b", secure=True, set_query={"a": "c"})
+    'https://example.com/?a=c'
+    """
+    builder = URLBuilder(URLBuilder.compile_arguments(get_argument_list(args, kwargs), strict=True))
+    return builder.build()
@@ -0,0 +1,125 @@
+"""Optional timing of spurl's hot paths.
+
+Set ``SPURL_INSTRUMENTATION = True`` to count, and time, every handler
+call, every inner template render and every URL build. The totals are
+kept per process and are available from get_timings(); each measurement
+is also sent as one of the signals in spurl.signals, so that it can be
+forwarded to a metrics system. When the setting is off, the only cost is
+one comparison per build, handler run and inner template render.
+
+Times are inclusive: a URL build includes its handlers, and a handler
+includes any inner templates it renders.
+"""
+
+import threading
+from collections import namedtuple
+from time import perf_counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from spurl import signals
+
+Timing = namedtuple("Timing", ["count", "total"])
+
+BUILD = "build"
+RENDER_TEMPLATE = "render_template"
+
+# Whether instrumentation is on. None until the setting is first read,
+# which is deferred so that importing spurl doesn't need settings. Hot
+# paths test `enabled is not False and is_enabled()`, which costs a
+# single comparison once the setting is known to be off
+enabled = None
+
+_lock = threading.Lock()
+_timings = {}
+# Number of enable() calls not yet matched by disable()
+_forced = 0
+
+
+def is_enabled():
+    global enabled
+    if enabled is None:
+        enabled = _forced > 0 or bool(getattr(settings, "SPURL_INSTRUMENTATION", False))
+    return enabled
+
+
+def enable():
+    """Turn instrumentation on, whatever SPURL_INSTRUMENTATION says, until
+    a matching call to disable(). Used by the debug toolbar panel"""
+    global enabled, _forced
+    with _lock:
+        _forced += 1
+        enabled = True
+
+
+def disable():
+    """Undo a call to enable()"""
+    global enabled, _forced
+    with _lock:
+        _forced -= 1
+        enabled = None
+
+
+@receiver(setting_changed)
+def reset_enabled(setting, **kwargs):
+    global enabled
+    if setting == "SPURL_INSTRUMENTATION":
+        enabled = None
+
+
+def record(name, duration):
+    """Add a measurement, in seconds, to the totals for name"""
+    with _lock:
+        count, total = _timings.get(name, (0, 0.0))
+        _timings[name] = Timing(count + 1, total + duration)
+
+
+def get_timings():
+    """Return a dict mapping each name measured ("build",
+    "render_template" and the handler names) to a Timing of the number
+    of measurements and their total duration in seconds"""
+    with _lock:
+        return dict(_timings)
+
+
+def reset_timings():
+    with _lock:
+        _timings.clear()
+
+
+def apply(builder, dispatch, values):
+    """Run the handlers in a dispatch list, as URLBuilder.apply does,
+    timing each one"""
+    sender = type(builder)
+    for (handler, _), value in zip(dispatch, values):
+        start = perf_counter()
+        if builder.pending_reverse is not None and handler.__name__ in builder.path_handler_names:
+            builder.apply_reverse()
+        handler(builder, value)
+        duration = perf_counter() - start
+        record(handler.__name__, duration)
+        signals.handler_called.send(sender=sender, handler=handler.__name__, duration=duration)
+
+
+def template_rendered(builder, template, duration):
+    record(RENDER_TEMPLATE, duration)
+    signals.inner_template_rendered.send(sender=type(builder), template=template, duration=duration)
+
+
+def node_rendered(node, builder, duration):
+    if builder is None:
+        path = "static"
+    elif builder.from_cache:
+        path = "cached"
+    elif builder.inner_templates:
+        path = "nested"
+    else:
+        path = "built"
+    signals.node_rendered.send(sender=type(node), node=node, duration=duration, path=path)
+
+
+def url_built(builder, url, duration):
+    record(BUILD, duration)
+    signals.url_built.send(sender=type(builder), url=url, duration=duration)
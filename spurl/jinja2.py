@@ -0,0 +1,95 @@
+from django.conf import settings
+from jinja2 import TemplateSyntaxError, nodes, pass_eval_context
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from spurl.core import URLBuilder
+
+# Handlers for each distinct tuple of argument names seen
+dispatch_cache = {}
+
+
+def build(names, values, autoescape):
+    """Build a URL from a tuple of argument names and a matching list of
+    values, escaping it for autoescaped output. Unknown arguments are
+    ignored, as they are in the Django template tag"""
+    handlers = dispatch_cache.get(names)
+    if handlers is None:
+        handlers = dispatch_cache[names] = [URLBuilder.get_handler(name) for name in names]
+    dispatch = [(handler, value) for handler, value in zip(handlers, values) if handler is not None]
+
+    builder = URLBuilder(dispatch, autoescape)
+    url = builder.build()
+    # Spurl has already escaped the URL (or been told not to), so stop
+    # Jinja escaping it again
+    if autoescape or builder.autoescape:
+        return Markup(url)
+    return url
+
+
+@pass_eval_context
+def spurl(eval_ctx, *args, **kwargs):
+    """Global function version of the spurl tag, for use in expressions:
+    {{ spurl(base=url, secure=True) }}. Arguments may be repeated by
+    passing a list of (name, value) pairs first"""
+    arguments = list(args[0]) if args else []
+    arguments.extend(kwargs.items())
+    names = tuple(name for name, value in arguments)
+    return build(names, [value for name, value in arguments], eval_ctx.autoescape)
+
+
+class SpurlExtension(Extension):
+    """Jinja2 extension providing a spurl tag, with the same arguments as
+    the Django template tag, separated by commas:
+
+    {% spurl base=request.get_full_path(), set_query="page=2" %}
+    {% spurl base=url, secure=True as secure_url %}
+
+    The argument names are resolved when the template is compiled, so each
+    render just evaluates the argument expressions and builds the URL. The
+    extension also adds a spurl() global function.
+    """
+
+    tags = {"spurl"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.globals.setdefault("spurl", spurl)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        names, values, target = [], [], None
+
+        while parser.stream.current.type != "block_end":
+            if names:
+                parser.stream.skip_if("comma")
+            if parser.stream.skip_if("name:as"):
+                target = nodes.Name(parser.stream.expect("name").value, "store", lineno=lineno)
+                break
+            name = parser.stream.expect("name")
+            if getattr(settings, "SPURL_STRICT_ARGUMENTS", False) and URLBuilder.get_handler(name.value) is None:
+                raise TemplateSyntaxError(
+                    "Unknown argument to spurl tag: '%s'" % name.value, name.lineno, parser.name, parser.filename
+                )
+            parser.stream.expect("assign")
+            names.append(name.value)
+            values.append(parser.parse_expression())
+
+        if not names:
+            parser.fail("'spurl' takes at least one argument", lineno)
+
+        call = self.call_method(
+            "_build",
+            [nodes.Const(tuple(names)), nodes.List(values, lineno=lineno), nodes.ContextReference()],
+            lineno=lineno,
+        )
+        if target is not None:
+            return nodes.Assign(target, call, lineno=lineno)
+        return nodes.Output([call], lineno=lineno)
+
+    def _build(self, names, values, context):
+        return build(names, values, context.eval_ctx.autoescape)
+
+
+# Nicer import name, like jinja2.ext.i18n
+spurl_extension = SpurlExtension
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from spurl import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark the spurl template tag and URL builder."
+
+    def add_arguments(self, parser):
+        benchmarks.add_arguments(parser)
+
+    def handle(self, *args, **options):
+        try:
+            regressions = benchmarks.main(Options(options), self.stdout)
+        except (ValueError, OSError) as e:
+            raise CommandError(e)
+        if regressions:
+            raise CommandError("Slower than the baseline")
+
+
+class Options:
+    """Attribute access to the options dict, as argparse would give"""
+
+    def __init__(self, options):
+        self.__dict__.update(options)
@@ -0,0 +1,153 @@
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from spurl.core import SpurlSpec
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# The specs used by a worker process, keyed by their JSON arguments
+worker_specs = {}
+
+
+def build_chunk_in_worker(chunk, spec_json):
+    """Build a chunk in a worker process. The spec is passed as its JSON
+    arguments with each chunk, rather than through a pool initializer,
+    which needs Python 3.7, and is only compiled once per process"""
+    spec = worker_specs.get(spec_json)
+    if spec is None:
+        # Worker processes which weren't forked need Django setting up again
+        django.setup()
+        spec = worker_specs[spec_json] = SpurlSpec(**json.loads(spec_json))
+    return build_chunk(chunk, spec)
+
+
+def build_chunk(chunk, spec):
+    """Build a URL for each (line number, JSON line) pair of a chunk of
+    input, returning the URLs, or raising ValueError for a bad line"""
+    current = None
+
+    def argument_lists():
+        nonlocal current
+        for current, line in chunk:
+            arguments = json.loads(line)
+            if not isinstance(arguments, (dict, list)):
+                raise ValueError("Expected a JSON object, or a list of [name, value] pairs")
+            yield arguments
+
+    try:
+        return list(spec.build_many(argument_lists()))
+    except Exception as e:
+        # Handlers given the wrong type of value can raise all sorts
+        raise ValueError("Line %d: %s: %s" % (current, type(e).__name__, e))
+
+
+def read_chunks(lines, chunk_size):
+    """Split lines into lists of (line number, line) pairs, skipping
+    blank lines"""
+    numbered = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a URL for each line of a JSONL file of spurl arguments, writing one URL per line, "
+        "in the same order as the input."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="JSONL file of argument dicts to read, or - for standard input")
+        parser.add_argument("-o", "--output", default="-", help="File to write the URLs to (default: standard output)")
+        parser.add_argument(
+            "--spec",
+            default="{}",
+            help="JSON object of arguments applied before each line's own, such as a shared base URL",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Number of processes building URLs (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Number of lines read, built and written at a time (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be at least 1")
+        try:
+            spec_arguments = json.loads(options["spec"])
+            if not isinstance(spec_arguments, dict):
+                raise ValueError("Expected a JSON object")
+            spec = SpurlSpec(**spec_arguments)
+        except (ValueError, TypeError) as e:
+            raise CommandError("Invalid --spec: %s" % e)
+
+        self.progress = options["verbosity"] >= 1
+        try:
+            input_file = sys.stdin if options["input"] == "-" else open(options["input"], encoding="utf-8")
+            try:
+                output = self.stdout if options["output"] == "-" else open(options["output"], "w", encoding="utf-8")
+                try:
+                    chunks = read_chunks(input_file, options["chunk_size"])
+                    if options["workers"] == 1:
+                        results = (build_chunk(chunk, spec) for chunk in chunks)
+                        self.write_results(results, output)
+                    else:
+                        with ProcessPoolExecutor(options["workers"]) as executor:
+                            results = self.map_chunks(executor, chunks, options["spec"], options["workers"] * 2)
+                            self.write_results(results, output)
+                finally:
+                    if output is not self.stdout:
+                        output.close()
+            finally:
+                if input_file is not sys.stdin:
+                    input_file.close()
+        except (ValueError, OSError) as e:
+            raise CommandError(e)
+
+    def map_chunks(self, executor, chunks, spec_json, window):
+        """Like executor.map(build_chunk_in_worker, ...), yielding results
+        in order, but with at most window chunks in flight, rather than
+        reading all of the input up front"""
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(build_chunk_in_worker, chunk, spec_json))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def write_results(self, results, output):
+        if output is self.stdout:
+            write = lambda text: output.write(text, ending="")  # noqa: E731
+        else:
+            write = output.write
+        start = last_report = time.perf_counter()
+        count = 0
+        for urls in results:
+            write("".join(url + "\n" for url in urls))
+            count += len(urls)
+            now = time.perf_counter()
+            if self.progress and now - last_report >= 1:
+                self.report(count, now - start)
+                last_report = now
+        if self.progress:
+            self.report(count, time.perf_counter() - start, done=True)
+
+    def report(self, count, elapsed, done=False):
+        rate = count / elapsed if elapsed else 0.0
+        message = "Built %d URLs%s in %.1fs (%.0f URLs/s)" % (count, "" if done else " so far", elapsed, rate)
+        # Progress goes to stderr, so it doesn't mix with URLs written to stdout
+        self.stderr.write(message, style_func=lambda message: message)
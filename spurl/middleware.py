@@ -0,0 +1,30 @@
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:  # asgiref < 3.6, or Django < 3.0, which doesn't use it
+    from asyncio import iscoroutinefunction
+
+from spurl.url import get_parsed_url  # noqa: F401
+
+
+def ParsedURLMiddleware(get_response):
+    """Parse the path of each request once, into request.spurl_url, so
+    that every spurl tag starting from it can share it"""
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            get_parsed_url(request)
+            return await get_response(request)
+
+    else:
+
+        def middleware(request):
+            get_parsed_url(request)
+            return get_response(request)
+
+    return middleware
+
+
+# What django.utils.decorators.sync_and_async_middleware does, on Django
+# 3.1 and later. Older versions ignore these, and only pass sync handlers
+ParsedURLMiddleware.sync_capable = True
+ParsedURLMiddleware.async_capable = True
@@ -0,0 +1,98 @@
+"""A django-debug-toolbar panel listing the spurl tags rendered during a
+request, with what they cost. Add it to DEBUG_TOOLBAR_PANELS:
+
+    DEBUG_TOOLBAR_PANELS = [
+        ...
+        "spurl.panels.SpurlPanel",
+    ]
+"""
+
+from asgiref.local import Local
+from debug_toolbar.panels import Panel
+from django.utils.translation import gettext_lazy as _
+from django.utils.translation import ngettext
+
+from spurl import instrumentation, signals
+
+
+class SpurlPanel(Panel):
+    """Times each {% spurl %} tag rendered while handling a request, and
+    how its URL was come by. Instrumentation is switched on while the
+    panel is enabled, whatever SPURL_INSTRUMENTATION says"""
+
+    title = _("Spurl")
+    template = "spurl/panel.html"
+    is_async = True
+
+    # The panel collecting for the current thread or task, if any
+    _context_locals = Local()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nodes = {}
+
+    @classmethod
+    def current_instance(cls):
+        return getattr(cls._context_locals, "current_instance", None)
+
+    @classmethod
+    def ready(cls):
+        signals.node_rendered.connect(record_node, dispatch_uid="spurl.panels.record_node")
+
+    def enable_instrumentation(self):
+        self._context_locals.current_instance = self
+        instrumentation.enable()
+
+    def disable_instrumentation(self):
+        instrumentation.disable()
+        if self.current_instance() is self:
+            self._context_locals.current_instance = None
+
+    def record(self, node, duration, path):
+        row = self.nodes.get(id(node))
+        if row is None:
+            origin = getattr(node, "origin", None)
+            token = getattr(node, "token", None)
+            row = self.nodes[id(node)] = {
+                "template": getattr(origin, "name", None) or "",
+                "line": getattr(token, "lineno", None),
+                "tag": token.contents if token is not None else "",
+                "renders": 0,
+                "cache_hits": 0,
+                "nested": 0,
+                "time": 0.0,
+            }
+        row["renders"] += 1
+        row["time"] += duration * 1000
+        if path in ("static", "cached"):
+            row["cache_hits"] += 1
+        elif path == "nested":
+            row["nested"] += 1
+
+    @property
+    def nav_subtitle(self):
+        stats = self.get_stats()
+        renders = stats.get("total_renders", 0)
+        return ngettext(
+            "%(renders)d tag in %(time).2fms",
+            "%(renders)d tags in %(time).2fms",
+            renders,
+        ) % {"renders": renders, "time": stats.get("total_time", 0)}
+
+    def generate_stats(self, request, response):
+        nodes = sorted(self.nodes.values(), key=lambda row: row["time"], reverse=True)
+        self.record_stats(
+            {
+                "nodes": nodes,
+                "total_renders": sum(row["renders"] for row in nodes),
+                "total_cache_hits": sum(row["cache_hits"] for row in nodes),
+                "total_nested": sum(row["nested"] for row in nodes),
+                "total_time": sum(row["time"] for row in nodes),
+            }
+        )
+
+
+def record_node(sender, node, duration, path, **kwargs):
+    panel = SpurlPanel.current_instance()
+    if panel is not None:
+        panel.record(node, duration, path)
@@ -0,0 +1,21 @@
+from django.dispatch import Signal
+
+# Sent while instrumentation is enabled (see spurl.instrumentation). The
+# sender is the builder class, and duration is in seconds.
+
+# Sent after each handler runs, with the handler name ("handle_base", ...)
+# and duration
+handler_called = Signal()
+
+# Sent after each inner template (one passed as an argument) is rendered,
+# with the template and duration
+inner_template_rendered = Signal()
+
+# Sent after each URL is built, with the url and duration
+url_built = Signal()
+
+# Sent after each {% spurl %} tag renders, with the node, duration and the
+# path taken to produce its URL: "static" (built when the template was
+# compiled), "cached" (see SPURL_CACHE_RENDERED_URLS), "nested" (built by
+# rendering inner templates) or "built"
+node_rendered = Signal()
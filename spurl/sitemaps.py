@@ -0,0 +1,145 @@
+"""Build URLs in bulk, and write them out as sitemaps.
+
+iter_urls() takes an iterable of records and a spurl argument spec, and
+lazily yields one URL for each record. write_sitemaps() writes any
+iterable of URLs to disk as sitemap XML files, starting a new file
+whenever the next URL would take the current one over the limits set by
+the sitemap protocol (50,000 URLs, or 50MB uncompressed). Neither holds
+more than one URL in memory at a time, so both work with iterables of
+any length:
+
+    spec = SpurlSpec(base="https://example.com/", secure=True)
+    urls = iter_urls(Product.objects.values("slug").iterator(), spec,
+                     lambda product: {"add_path": product["slug"]})
+    write_sitemaps(urls, "/srv/sitemaps/", base_url="https://example.com/sitemaps/")
+"""
+
+import gzip
+import os
+from xml.sax.saxutils import escape
+
+from spurl.core import SpurlSpec
+
+MAX_URLS = 50000
+MAX_BYTES = 50 * 1024 * 1024
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NAMESPACE = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+URLSET_HEADER = (XML_DECLARATION + '<urlset xmlns="%s">\n' % SITEMAP_NAMESPACE).encode("utf-8")
+URLSET_FOOTER = "</urlset>\n".encode("utf-8")
+
+INDEX_HEADER = (XML_DECLARATION + '<sitemapindex xmlns="%s">\n' % SITEMAP_NAMESPACE).encode("utf-8")
+INDEX_FOOTER = "</sitemapindex>\n".encode("utf-8")
+
+# Optional child elements of <url>, in the order the protocol gives them
+URL_FIELDS = ("lastmod", "changefreq", "priority")
+
+
+def iter_urls(records, spec, arguments=None):
+    """Lazily yield a URL for each record. spec is a SpurlSpec, or a dict
+    of the arguments shared by every URL. By default each record is
+    itself a dict (or list of (name, value) pairs) of further arguments;
+    otherwise arguments is called with each record to get them"""
+    if not isinstance(spec, SpurlSpec):
+        spec = SpurlSpec(**spec)
+    if arguments is not None:
+        records = map(arguments, records)
+    return spec.build_many(records)
+
+
+def format_url(entry):
+    """Return the <url> element for a sitemap entry: either a URL, or a
+    dict with a "loc" key and, optionally, lastmod, changefreq and
+    priority. lastmod may be a date or datetime"""
+    if not isinstance(entry, dict):
+        return "<url><loc>%s</loc></url>\n" % escape(str(entry))
+    parts = ["<url><loc>%s</loc>" % escape(str(entry["loc"]))]
+    for field in URL_FIELDS:
+        value = entry.get(field)
+        if value is not None:
+            if hasattr(value, "isoformat"):
+                value = value.isoformat()
+            parts.append("<%s>%s</%s>" % (field, escape(str(value)), field))
+    parts.append("</url>\n")
+    return "".join(parts)
+
+
+class SitemapWriter:
+    """Writes sitemap entries to a numbered series of files in directory,
+    named <prefix>-1.xml, <prefix>-2.xml and so on (with .gz on the end if
+    compress is true), each within max_urls entries and max_bytes bytes
+    of uncompressed XML"""
+
+    def __init__(self, directory, prefix="sitemap", max_urls=MAX_URLS, max_bytes=MAX_BYTES, compress=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.paths = []
+        self.file = None
+        self.urls = self.bytes = 0
+
+    def open_shard(self):
+        name = "%s-%d.xml" % (self.prefix, len(self.paths) + 1)
+        if self.compress:
+            name += ".gz"
+        path = os.path.join(self.directory, name)
+        self.file = gzip.open(path, "wb") if self.compress else open(path, "wb")
+        self.paths.append(path)
+        self.file.write(URLSET_HEADER)
+        self.urls, self.bytes = 0, len(URLSET_HEADER) + len(URLSET_FOOTER)
+
+    def close_shard(self):
+        if self.file is not None:
+            self.file.write(URLSET_FOOTER)
+            self.file.close()
+            self.file = None
+
+    def write(self, entry):
+        data = format_url(entry).encode("utf-8")
+        if len(URLSET_HEADER) + len(data) + len(URLSET_FOOTER) > self.max_bytes:
+            raise ValueError("Sitemap entry is too large for max_bytes: %r" % entry)
+        if self.file is None or self.urls >= self.max_urls or self.bytes + len(data) > self.max_bytes:
+            self.close_shard()
+            self.open_shard()
+        self.file.write(data)
+        self.urls += 1
+        self.bytes += len(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close_shard()
+
+
+def write_sitemap_index(path, urls):
+    """Write a sitemap index file listing the given sitemap URLs"""
+    with open(path, "wb") as f:
+        f.write(INDEX_HEADER)
+        for url in urls:
+            f.write(("<sitemap><loc>%s</loc></sitemap>\n" % escape(url)).encode("utf-8"))
+        f.write(INDEX_FOOTER)
+
+
+def write_sitemaps(
+    urls, directory, base_url=None, prefix="sitemap", max_urls=MAX_URLS, max_bytes=MAX_BYTES, compress=False
+):
+    """Write an iterable of sitemap entries (URLs, or dicts as accepted
+    by format_url) to sitemap files in directory, returning their paths.
+    If base_url, the URL the files will be served from, is given, a
+    sitemap index, <prefix>.xml, is written alongside them"""
+    with SitemapWriter(directory, prefix, max_urls, max_bytes, compress) as writer:
+        for entry in urls:
+            writer.write(entry)
+
+    if base_url is not None:
+        if not base_url.endswith("/"):
+            base_url += "/"
+        write_sitemap_index(
+            os.path.join(directory, "%s.xml" % prefix),
+            (base_url + os.path.basename(path) for path in writer.paths),
+        )
+    return writer.paths
@@ -1,255 +1,306 @@
 import re
+from time import perf_counter
 
 import django
 from django.conf import settings
-from django.template import Library, Node, Origin, Template, TemplateSyntaxError
-from django.template.base import Lexer, Parser
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template import Context, Library, Node, Origin, Template, TemplateSyntaxError
+from django.template.base import Lexer, Parser, Variable
 from django.template.defaulttags import kwarg_re
-from django.utils.encoding import smart_str
-from django.utils.html import escape
-from urlobject import URLObject
-from urlobject.query_string import QueryString
+from django.utils.safestring import SafeString, mark_safe
+
+from spurl import instrumentation
+from spurl.cache import LRUCache, make_url_key
+from spurl.core import URLBuilder, convert_to_boolean, reverse_context  # noqa: F401
+from spurl.url import ParsedURL
 
 register = Library()
 
-TRUE_RE = re.compile(r"^(true|on)$", flags=re.IGNORECASE)
+TEMPLATE_SYNTAX_RE = re.compile(r"{(\\?%|{|#)|%\\}")
 
+DEFAULT_TEMPLATE_CACHE_SIZE = 256
 
-def convert_to_boolean(string_or_boolean):
-    if isinstance(string_or_boolean, bool):
-        return string_or_boolean
-    if isinstance(string_or_boolean, str):
-        return bool(TRUE_RE.match(string_or_boolean))
+# Cache used for tags with a cache_timeout argument
+DEFAULT_CACHE_ALIAS = "default"
 
+# Key under which parsed *_from URLs are shared in the render context
+PARSED_URLS_KEY = "spurl_parsed_urls"
 
-class SpurlURLBuilder:
-    def __init__(self, args, context, tags, filters):
-        self.args = args
-        self.context = context
-        self.tags = tags
-        self.filters = filters
-        self.autoescape = self.context.autoescape
-        self.url = URLObject()
+# Inner templates which are only known at render time (for example,
+# variables whose value contains template syntax) are compiled once per
+# process and kept here, keyed on the template string and the identity
+# of the tags and filters of the parent template's parser
+template_cache = LRUCache(lambda: getattr(settings, "SPURL_TEMPLATE_CACHE_SIZE", DEFAULT_TEMPLATE_CACHE_SIZE))
 
-    def build(self):
-        for argument, value in self.args:
-            self.handle_argument(argument, value)
 
-        self.set_sensible_defaults()
+if django.VERSION >= (3, 2):
+    from django.template.autoreload import get_template_directories
+    from django.utils.autoreload import file_changed
 
-        url = str(self.url)
+    @receiver(file_changed, dispatch_uid="spurl_template_cache_file_changed")
+    def template_changed(sender, file_path, **kwargs):
+        """Clear the template cache whenever the autoreloader resets
+        Django's cached template loaders, so that runserver picks up
+        edits to templates. Returns None, leaving the decision whether
+        to restart the server to Django"""
+        if file_path.suffix == ".py":
+            return
+        for template_dir in get_template_directories():
+            if template_dir in file_path.parents:
+                template_cache.clear()
+                return
 
-        if self.autoescape:
-            url = escape(url)
 
-        return url
+@receiver(setting_changed, dispatch_uid="spurl_template_cache_setting_changed")
+def template_settings_changed(setting, **kwargs):
+    if setting in ("TEMPLATES", "SPURL_NESTED_TEMPLATES"):
+        template_cache.clear()
 
-    def handle_argument(self, argument, value):
-        argument = smart_str(argument, "ascii")
-        handler_name = "handle_%s" % argument
-        handler = getattr(self, handler_name, None)
 
-        if handler is not None:
-            value = value.resolve(self.context)
-            handler(value)
-
-    def handle_base(self, value):
-        base = self.prepare_value(value)
-        self.url = URLObject(base)
-
-    def handle_auth(self, value):
-        auth = self.prepare_value(value)
-        self.url = self.url.with_auth(*auth.split(":", 1))
-
-    def handle_secure(self, value):
-        is_secure = convert_to_boolean(value)
-        scheme = "https" if is_secure else "http"
-        self.url = self.url.with_scheme(scheme)
-
-    def handle_query(self, value):
-        query = self.prepare_value(value)
-        if isinstance(query, dict):
-            query = QueryString().set_params(**query)
-        self.url = self.url.with_query(QueryString(query))
-
-    def handle_query_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.with_query(url.query)
-
-    def handle_add_query(self, value):
-        query_to_add = self.prepare_value(value)
-        if isinstance(query_to_add, str):
-            query_to_add = QueryString(query_to_add).dict
-        self.url = self.url.add_query_params(**query_to_add)
-
-    def handle_add_query_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.add_query_params(**url.query.dict)
-
-    def handle_set_query(self, value):
-        query_to_set = self.prepare_value(value)
-        if isinstance(query_to_set, str):
-            query_to_set = QueryString(query_to_set).dict
-        self.url = self.url.set_query_params(**query_to_set)
-
-    def handle_set_query_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.set_query_params(**url.query.dict)
-
-    def handle_remove_query_param(self, value):
-        query_to_remove = self.prepare_value(value)
-        if "=" in query_to_remove:
-            k, v = query_to_remove.split("=", 1)
-            self.url = self.url.del_query_param_value(k, v)
-        else:
-            self.url = self.url.del_query_param(query_to_remove)
-
-    def handle_remove_query_params_except(self, value):
-        params_to_keep = self.prepare_value(value).split(" ")
-        params_to_remove = [pair[0] for pair in self.url.query_list if pair[0] not in params_to_keep]
-        self.url = self.url.with_query(self.url.query.del_params(params_to_remove))
-
-    def handle_toggle_query(self, value):
-        query_to_toggle = self.prepare_value(value)
-        if isinstance(query_to_toggle, str):
-            query_to_toggle = QueryString(query_to_toggle).dict
-        current_query = self.url.query.dict
-        for key, value in list(query_to_toggle.items()):
-            if isinstance(value, str):
-                value = value.split(",")
-            first, second = value
-            if key in current_query and first == current_query[key]:
-                self.url = self.url.set_query_param(key, second)
-            else:
-                self.url = self.url.set_query_param(key, first)
-
-    def handle_scheme(self, value):
-        self.url = self.url.with_scheme(value)
-
-    def handle_scheme_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.with_scheme(url.scheme)
-
-    def handle_host(self, value):
-        host = self.prepare_value(value)
-        self.url = self.url.with_hostname(host)
-
-    def handle_host_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.with_hostname(url.hostname)
+def unescape_tags(template_string):
+    r"""Spurl allows the use of templatetags inside templatetags, if
+    the inner templatetags are escaped - {\% and %\}"""
+    return template_string.replace(r"{\%", "{%").replace(r"%\}", "%}")
 
-    def handle_path(self, value):
-        path = self.prepare_value(value)
-        self.url = self.url.with_path(path)
 
-    def handle_path_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.with_path(url.path)
+def contains_template_syntax(string):
+    r"""Check whether a string contains anything that Django's template
+    system would interpret: {{, {%, {# or an escaped {\% or %\}"""
+    return TEMPLATE_SYNTAX_RE.search(string) is not None
 
-    def handle_add_path(self, value):
-        path_to_add = self.prepare_value(value)
-        self.url = self.url.add_path(path_to_add)
 
-    def handle_add_path_from(self, value):
-        url = URLObject(value)
-        path_to_add = url.path
-        if path_to_add.startswith("/"):
-            path_to_add = path_to_add[1:]
-        self.url = self.url.add_path(path_to_add)
+def nested_templates_enabled():
+    return getattr(settings, "SPURL_NESTED_TEMPLATES", True)
 
-    def handle_fragment(self, value):
-        fragment = self.prepare_value(value)
-        self.url = self.url.with_fragment(fragment)
 
-    def handle_fragment_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.with_fragment(url.fragment)
+def compile_string(template_string, tags, filters, origin=None, template_debug=False):
+    """Re-implementation of django.template.base.compile_string
+    that takes into account the tags and filter of the parser
+    that rendered the parent template"""
+    if template_debug is True:
+        if django.VERSION < (1, 9):
+            from django.template.debug import DebugLexer, DebugParser
 
-    def handle_port(self, value):
-        self.url = self.url.with_port(int(value))
+            lexer_class, parser_class = DebugLexer, DebugParser
+        else:
+            from django.template.base import DebugLexer
+
+            lexer_class, parser_class = DebugLexer, Parser
+    else:
+        lexer_class, parser_class = Lexer, Parser
+    if django.VERSION < (1, 9):
+        lexer = lexer_class(template_string, origin)
+    else:
+        lexer = lexer_class(template_string)
+    parser = parser_class(lexer.tokenize())
+
+    # Attach the tags and filters from the parent parser
+    parser.tags = tags
+    parser.filters = filters
+
+    return parser.parse()
+
+
+def compile_template(template_string, tags, filters):
+    """Build a Template for an "inner" template string, ie one which
+    is passed as an argument to spurl"""
+    template = Template("")
+    template_debug = getattr(
+        settings, "TEMPLATE_DEBUG", template.engine.debug if hasattr(template, "engine") else False
+    )
+    if template_debug is True:
+        origin = Origin(template_string)
+    else:
+        origin = None
+
+    template.nodelist = compile_string(template_string, tags, filters, origin, template_debug)
+    return template
+
+
+def get_compiled_template(template_string, tags, filters):
+    """Fetch the compiled Template for an inner template string from
+    the template cache, compiling and storing it on a miss"""
+    key = (template_string, id(tags), id(filters))
+    cached = template_cache.get(key)
+    # Holding on to tags and filters guards against their ids being reused
+    if cached is not None and cached[0] is tags and cached[1] is filters:
+        return cached[2]
+    template = compile_template(template_string, tags, filters)
+    template_cache.set(key, (tags, filters, template))
+    return template
+
+
+def inner_context(context):
+    """Return a context for rendering an inner template. It sees the same
+    variables as context, but anything the inner template sets goes into
+    a dict of its own, and it doesn't autoescape. The original context
+    isn't touched, so it is left as it was even if rendering fails"""
+    # A cheaper equivalent of copy(context) followed by push(). The render
+    # context can be shared: Template.render always restores its state
+    inner = object.__new__(type(context))
+    inner.__dict__ = context.__dict__.copy()
+    inner.dicts = context.dicts + [{}]
+    inner.autoescape = False
+    return inner
+
+
+def get_literal(filter_expression):
+    """Return the constant string a spurl argument was given, or None
+    if its value can only be known at render time"""
+    if filter_expression.filters or not isinstance(filter_expression.var, str):
+        return None
+    return filter_expression.var
+
+
+def is_constant(filter_expression):
+    """Check whether a spurl argument resolves to the same value
+    on every render, regardless of the context"""
+    if filter_expression.filters:
+        return False
+    var = filter_expression.var
+    if isinstance(var, Variable):
+        return var.lookups is None and not var.translate
+    return True
+
+
+def strict_arguments_enabled():
+    return getattr(settings, "SPURL_STRICT_ARGUMENTS", False)
+
+
+def build_static_urls(args, tags, filters, dispatch=None):
+    """Build the URL for a set of constant arguments up front, both
+    with and without autoescaping. Returns None if the URL can only
+    be built at render time"""
+    if not all(is_constant(value) for name, value in args):
+        return None
+    if any(name in SpurlURLBuilder.request_dependent_arguments for name, value in args):
+        return None
+    static_urls = {}
+    for autoescape in (False, True):
+        builder = SpurlURLBuilder(args, Context(autoescape=autoescape), tags, filters, dispatch=dispatch)
+        try:
+            static_urls[autoescape] = builder.build()
+        except Exception:
+            # Leave any errors to be raised when the node is rendered,
+            # as they would be if the URL weren't folded
+            return None
+    return static_urls
+
+
+class SpurlURLBuilder(URLBuilder):
+    unknown_argument_error = TemplateSyntaxError
+
+    def __init__(self, args, context, tags, filters, templates=None, dispatch=None):
+        self.args = args
+        self.context = context
+        self.tags = tags
+        self.filters = filters
+        self.templates = templates or {}
+        # How the URL was come by, for instrumentation
+        self.from_cache = False
+        self.inner_templates = 0
+        if dispatch is None:
+            dispatch = self.compile_arguments(args)
+        super().__init__(dispatch, self.context.autoescape)
 
-    def handle_port_from(self, value):
-        url = URLObject(value)
-        self.url = self.url.with_port(url.port)
+    def resolve_value(self, value):
+        return value.resolve(self.context)
 
-    def handle_autoescape(self, value):
-        self.autoescape = convert_to_boolean(value)
+    def handle_argument(self, argument, value):
+        handler = self.get_handler(argument)
 
-    def set_sensible_defaults(self):
-        if self.url.hostname and not self.url.scheme:
-            self.url = self.url.with_scheme("http")
+        if handler is not None:
+            value = value.resolve(self.context)
+            handler(self, value)
+
+    def parse_url(self, value):
+        """Parse a URL passed to one of the *_from arguments. Each distinct
+        URL is only parsed once per render of the outer template, however
+        many arguments (and spurl tags) refer to it"""
+        if isinstance(value, ParsedURL):
+            return value
+        if self.parsed_urls is None:
+            if getattr(settings, "SPURL_SHARE_PARSED_URLS", True):
+                self.parsed_urls = self.context.render_context.setdefault(PARSED_URLS_KEY, {})
+            else:
+                self.parsed_urls = {}
+        return super().parse_url(value)
 
     def prepare_value(self, value):
         """Prepare a value by unescaping embedded template tags
-        and rendering through Django's template system"""
+        and rendering through Django's template system. Strings
+        without any template syntax are returned untouched"""
         if isinstance(value, str):
-            value = self.render_template(self.unescape_tags(value))
+            if not contains_template_syntax(value) or not nested_templates_enabled():
+                return value
+            template = self.templates.get(value)
+            if template is None:
+                value = self.render_template(self.unescape_tags(value))
+            else:
+                value = self.render_compiled_template(template)
         return value
 
     def unescape_tags(self, template_string):
-        r"""Spurl allows the use of templatetags inside templatetags, if
-        the inner templatetags are escaped - {\% and %\}"""
-        return template_string.replace(r"{\%", "{%").replace(r"%\}", "%}")
+        return unescape_tags(template_string)
 
     def compile_string(self, template_string, origin, template_debug=False):
-        """Re-implementation of django.template.base.compile_string
-        that takes into account the tags and filter of the parser
-        that rendered the parent template"""
-        if template_debug is True:
-            if django.VERSION < (1, 9):
-                from django.template.debug import DebugLexer, DebugParser
-
-                lexer_class, parser_class = DebugLexer, DebugParser
-            else:
-                from django.template.base import DebugLexer
-
-                lexer_class, parser_class = DebugLexer, Parser
-        else:
-            lexer_class, parser_class = Lexer, Parser
-        if django.VERSION < (1, 9):
-            lexer = lexer_class(template_string, origin)
-        else:
-            lexer = lexer_class(template_string)
-        parser = parser_class(lexer.tokenize())
-
-        # Attach the tags and filters from the parent parser
-        parser.tags = self.tags
-        parser.filters = self.filters
-
-        return parser.parse()
+        return compile_string(template_string, self.tags, self.filters, origin, template_debug)
 
     def render_template(self, template_string):
         """Used to render an "inner" template, ie one which
         is passed as an argument to spurl"""
-        original_autoescape = self.context.autoescape
-        self.context.autoescape = False
+        template = get_compiled_template(template_string, self.tags, self.filters)
+        return self.render_compiled_template(template)
 
-        template = Template("")
-        template_debug = getattr(
-            settings, "TEMPLATE_DEBUG", template.engine.debug if hasattr(template, "engine") else False
-        )
-        if template_debug is True:
-            origin = Origin(template_string)
+    def render_compiled_template(self, template):
+        if instrumentation.enabled is not False and instrumentation.is_enabled():
+            start = perf_counter()
         else:
-            origin = None
-
-        template.nodelist = self.compile_string(template_string, origin, template_debug)
-
-        rendered = template.render(self.context)
-        self.context.autoescape = original_autoescape
+            start = None
+        rendered = template.render(inner_context(self.context))
+        self.inner_templates += 1
+        if start is not None:
+            instrumentation.template_rendered(self, template, perf_counter() - start)
         return rendered
 
 
 class SpurlNode(Node):
-    def __init__(self, args, tags, filters, asvar=None):
+    def __init__(
+        self, args, tags, filters, asvar=None, templates=None, static_urls=None, dispatch=None, cache_timeout=None
+    ):
         self.args = args
         self.asvar = asvar
         self.tags = tags
         self.filters = filters
+        self.templates = templates or {}
+        self.static_urls = static_urls
+        if dispatch is None:
+            dispatch = SpurlURLBuilder.compile_arguments(args)
+        self.dispatch = dispatch
+        self.cache_timeout = cache_timeout
 
     def render(self, context):
-        builder = SpurlURLBuilder(self.args, context, self.tags, self.filters)
-        url = builder.build()
+        if instrumentation.enabled is not False and instrumentation.is_enabled():
+            start = perf_counter()
+        else:
+            start = None
+        builder = None
+        if self.static_urls is not None:
+            url = self.static_urls[bool(context.autoescape)]
+        else:
+            builder = SpurlURLBuilder(self.args, context, self.tags, self.filters, self.templates, self.dispatch)
+            if self.templates:
+                url = builder.build()
+            elif self.cache_timeout is not None:
+                url = self.build_shared(builder, context)
+            elif getattr(settings, "SPURL_CACHE_RENDERED_URLS", False):
+                url = self.build_cached(builder, context)
+            else:
+                url = builder.build()
+        if start is not None:
+            instrumentation.node_rendered(self, builder, perf_counter() - start)
 
         if self.asvar:
             context[self.asvar] = url
@@ -257,6 +308,127 @@ class SpurlNode(Node):
 
         return url
 
+    def build_cached(self, builder, context):
+        """Build the URL, reusing the result of any earlier render of this
+        node, within the same template render, whose arguments resolved to
+        the same values"""
+        values = builder.resolve_values()
+        # Nested templates may depend on anything in the context
+        if nested_templates_enabled() and any(
+            isinstance(value, str) and contains_template_syntax(value) for value in values
+        ):
+            return builder.build(values)
+        # Equal values of different types, like True and 1, may build
+        # different URLs
+        key = (tuple((type(value), value) for value in values), bool(context.autoescape))
+        try:
+            hash(key)
+        except TypeError:
+            return builder.build(values)
+        urls = context.render_context.setdefault(self, {})
+        url = urls.get(key)
+        if url is None:
+            url = urls[key] = builder.build(values)
+        else:
+            builder.from_cache = True
+        return url
+
+    def build_shared(self, builder, context):
+        """Build the URL through Django's cache framework, keyed on the
+        resolved argument values, for the number of seconds given by the
+        tag's cache_timeout argument"""
+        try:
+            timeout = self.resolve_cache_timeout(context)
+        except (TypeError, ValueError):
+            # An undefined or non-numeric timeout means don't cache at all
+            return builder.build()
+        values = builder.resolve_values()
+        if nested_templates_enabled() and any(
+            isinstance(value, str) and contains_template_syntax(value) for value in values
+        ):
+            return builder.build(values)
+        names = [handler.__name__ for handler, value in self.dispatch]
+        if any(name in SpurlURLBuilder.request_dependent_arguments for name, value in self.args):
+            # reverse() depends on the urlconf, script prefix and language too
+            names, values = names + ["reverse_context"], values + [reverse_context()]
+        key = make_url_key(names, values, context.autoescape)
+        if key is None:
+            return builder.build(values)
+        cache = caches[getattr(settings, "SPURL_CACHE_ALIAS", DEFAULT_CACHE_ALIAS)]
+        cached = cache.get(key)
+        if cached is None:
+            url = builder.build(values)
+            # The tag's own autoescape argument may have switched escaping
+            # off, so remember whether this URL was escaped
+            cache.set(key, (str(url), builder.autoescape), timeout)
+        else:
+            builder.from_cache = True
+            url, builder.autoescape = cached
+            if builder.autoescape:
+                url = SafeString(url)
+        return url
+
+    def resolve_cache_timeout(self, context):
+        """Return the cache_timeout argument as a number of seconds, or
+        None to cache forever. Raises ValueError or TypeError if it is
+        neither"""
+        timeout = self.cache_timeout.resolve(context)
+        if timeout is None:
+            return None
+        return int(timeout)
+
+
+def check_cache_timeout(cache_timeout):
+    """Raise TemplateSyntaxError if a compiled cache_timeout argument is a
+    literal other than a whole number of seconds"""
+    if cache_timeout.filters:
+        return
+    var = cache_timeout.var
+    literal = var.literal if isinstance(var, Variable) else var
+    if literal is None:
+        return
+    if isinstance(literal, str):
+        valid = literal.strip().lstrip("-").isdigit()
+    else:
+        valid = isinstance(literal, int)
+    if not valid:
+        raise TemplateSyntaxError("spurl's cache_timeout must be a whole number of seconds, or None: %r" % literal)
+
+
+def pop_argument(bits, name):
+    """Remove a name=value argument from a tag's bits, returning the
+    value or None if it isn't there"""
+    prefix = name + "="
+    for i, bit in enumerate(bits):
+        if bit.startswith(prefix):
+            del bits[i]
+            return bit[len(prefix) :]
+    return None
+
+
+def compile_spurl_arguments(parser, bits, tag_name="spurl"):
+    """Compile the key=value arguments of a spurl tag. Returns the
+    arguments, their dispatch list and any precompiled nested templates"""
+    args = []
+    for bit in bits:
+        name, value = kwarg_re.match(bit).groups()
+        if not (name and value):
+            raise TemplateSyntaxError("Malformed arguments to %s tag" % tag_name)
+        args.append((name, parser.compile_filter(value)))
+
+    dispatch = SpurlURLBuilder.compile_arguments(args, strict=strict_arguments_enabled())
+
+    # Literal arguments containing nested templates are compiled once,
+    # here, rather than every time the node is rendered
+    templates = {}
+    if nested_templates_enabled():
+        for name, value in args:
+            literal = get_literal(value)
+            if literal is not None and literal not in templates and contains_template_syntax(literal):
+                templates[literal] = compile_template(unescape_tags(literal), parser.tags, parser.filters)
+
+    return args, dispatch, templates
+
 
 @register.tag
 def spurl(parser, token):
@@ -264,7 +436,6 @@ def spurl(parser, token):
     if len(bits) < 2:
         raise TemplateSyntaxError("'spurl' takes at least one argument")
 
-    args = []
     asvar = None
     bits = bits[1:]
 
@@ -272,9 +443,145 @@ def spurl(parser, token):
         asvar = bits[-1]
         bits = bits[:-2]
 
-    for bit in bits:
-        name, value = kwarg_re.match(bit).groups()
-        if not (name and value):
-            raise TemplateSyntaxError("Malformed arguments to spurl tag")
-        args.append((name, parser.compile_filter(value)))
-    return SpurlNode(args, parser.tags, parser.filters, asvar)
+    cache_timeout = pop_argument(bits, "cache_timeout")
+    if cache_timeout is not None:
+        cache_timeout = parser.compile_filter(cache_timeout)
+        check_cache_timeout(cache_timeout)
+
+    args, dispatch, templates = compile_spurl_arguments(parser, bits)
+
+    # If every argument is a constant, so is the URL
+    static_urls = None
+    if not templates:
+        static_urls = build_static_urls(args, parser.tags, parser.filters, dispatch)
+
+    return SpurlNode(args, parser.tags, parser.filters, asvar, templates, static_urls, dispatch, cache_timeout)
+
+
+def refers_to(filter_expression, names):
+    """Check whether a spurl argument might depend on any of the given
+    variable names. Errs on the side of saying it does, except for
+    variables whose values are nested templates, which SpurlForNode checks
+    for when it renders"""
+    variables = [filter_expression.var]
+    for func, filter_args in filter_expression.filters:
+        variables.extend(arg for lookup, arg in filter_args if lookup)
+    for var in variables:
+        if isinstance(var, Variable):
+            if var.lookups and var.lookups[0] in names:
+                return True
+        elif isinstance(var, str) and contains_template_syntax(var):
+            if any(re.search(r"\b%s\b" % re.escape(name), var) for name in names):
+                return True
+    return False
+
+
+class SpurlForNode(Node):
+    child_nodelists = ("nodelist",)
+
+    def __init__(self, loopvars, sequence, args, tags, filters, asvar, nodelist, templates=None, dispatch=None):
+        self.loopvars = loopvars
+        self.sequence = sequence
+        self.args = args
+        self.tags = tags
+        self.filters = filters
+        self.asvar = asvar
+        self.nodelist = nodelist
+        self.templates = templates or {}
+        if dispatch is None:
+            dispatch = SpurlURLBuilder.compile_arguments(args)
+
+        # Everything up to the first argument which depends on the loop
+        # variables is applied once, before the loop starts
+        for index, (handler, value) in enumerate(dispatch):
+            if refers_to(value, loopvars):
+                break
+        else:
+            index = len(dispatch)
+        self.fixed, self.varying = dispatch[:index], dispatch[index:]
+
+    def render(self, context):
+        values = self.sequence.resolve(context, ignore_failures=True)
+        if values is None:
+            values = []
+        if not hasattr(values, "__len__"):
+            values = list(values)
+        if not values:
+            # Like {% for %}, an empty loop renders nothing, so there's no
+            # need to resolve any arguments
+            return ""
+        output = []
+        instrumented = instrumentation.enabled is not False and instrumentation.is_enabled()
+        if instrumented:
+            start = perf_counter()
+        with context.push():
+            builder = SpurlURLBuilder(self.args, context, self.tags, self.filters, self.templates, self.fixed)
+            fixed, varying = self.fixed, self.varying
+            fixed_values = builder.resolve_values(fixed)
+            if nested_templates_enabled():
+                # A variable may hold a nested template which uses the loop
+                # variables, so apply it, and everything after it, per item
+                for index, value in enumerate(fixed_values):
+                    if isinstance(value, str) and contains_template_syntax(value):
+                        fixed, varying = fixed[:index], fixed[index:] + varying
+                        fixed_values = fixed_values[:index]
+                        break
+            builder.apply(fixed, fixed_values)
+            base_url, autoescape, canonical = builder.url, builder.autoescape, builder.canonical
+            pending_reverse = builder.pending_reverse
+
+            for item in values:
+                if len(self.loopvars) == 1:
+                    context[self.loopvars[0]] = item
+                else:
+                    if len(item) != len(self.loopvars):
+                        raise ValueError(
+                            "Need %d values to unpack in spurlfor; got %d." % (len(self.loopvars), len(item))
+                        )
+                    for name, value in zip(self.loopvars, item):
+                        context[name] = value
+
+                builder.url, builder.autoescape, builder.canonical = base_url.copy(), autoescape, canonical
+                builder.pending_reverse = None if pending_reverse is None else list(pending_reverse)
+                builder.apply(varying, builder.resolve_values(varying))
+                url = context[self.asvar] = builder.finish()
+                if instrumented:
+                    # Each item counts as a render of the tag, the first one
+                    # including the arguments applied before the loop
+                    duration = perf_counter() - start
+                    instrumentation.url_built(builder, url, duration)
+                    instrumentation.node_rendered(self, builder, duration)
+                    builder.inner_templates = 0
+                output.append(self.nodelist.render(context))
+                if instrumented:
+                    start = perf_counter()
+        return mark_safe("".join(output))
+
+
+@register.tag
+def spurlfor(parser, token):
+    """Loop over a sequence, building a URL for each item. Arguments which
+    don't refer to the loop variables are only resolved and applied once:
+
+    {% spurlfor page in pages base=request.get_full_path set_query="page={{ page }}" as url %}
+        <a href="{{ url }}">{{ page }}</a>
+    {% endspurlfor %}
+    """
+    bits = token.split_contents()
+    if "in" not in bits or len(bits) < 6 or bits[-2] != "as":
+        raise TemplateSyntaxError(
+            "'spurlfor' statements should use the format 'spurlfor x in y key=value ... as url': %s" % token.contents
+        )
+    in_index = bits.index("in")
+    loopvars = [var.strip() for var in " ".join(bits[1:in_index]).split(",")]
+    if not all(loopvars):
+        raise TemplateSyntaxError("'spurlfor' tag received an invalid argument: %s" % token.contents)
+    sequence = parser.compile_filter(bits[in_index + 1])
+    asvar = bits[-1]
+
+    args, dispatch, templates = compile_spurl_arguments(parser, bits[in_index + 2 : -2], "spurlfor")
+
+    nodelist = parser.parse(("endspurlfor",))
+    parser.delete_first_token()
+
+    return SpurlForNode(loopvars, sequence, args, parser.tags, parser.filters, asvar, nodelist, templates, dispatch)
@@ -0,0 +1,337 @@
+import re
+from urllib.parse import urlsplit, urlunsplit, uses_netloc
+
+from urlobject.netloc import Netloc
+from urlobject.path import URLPath, path_decode, path_encode
+from urlobject.query_string import QueryString, qs_encode
+
+PERCENT_ENCODED_RE = re.compile(r"%[0-9a-fA-F]{2}")
+
+UNRESERVED_CHARACTERS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+def normalize_percent_encoding(string):
+    """Decode percent-encoded unreserved characters, and uppercase the
+    hex digits of everything else that is percent-encoded (RFC 3986,
+    section 6.2.2)"""
+
+    def normalize(match):
+        character = chr(int(match.group(0)[1:], 16))
+        if character in UNRESERVED_CHARACTERS:
+            return character
+        return match.group(0).upper()
+
+    if "%" not in string:
+        return string
+    return PERCENT_ENCODED_RE.sub(normalize, string)
+
+
+def expand_query_param(name, value):
+    """Turn a query parameter into a list of decoded (name, value) pairs,
+    exactly as they would be read back from URLObject's query string"""
+    if value is not None and not isinstance(value, str) and hasattr(value, "__iter__"):
+        return [(decode_query_value(name), decode_query_value(val)) for val in value]
+    return [(decode_query_value(name), decode_query_value(value))]
+
+
+def decode_query_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return str(value)
+    # Let qs_encode raise for anything it can't handle
+    return qs_encode(value)
+
+
+def encode_query_param(name, value):
+    """Encode a query parameter in the same way as URLObject's
+    QueryString.add_param"""
+    if value is None:
+        return qs_encode(name)
+    if not isinstance(value, str) and hasattr(value, "__iter__"):
+        return "&".join([qs_encode(name) + "=" + qs_encode(val) for val in value])
+    return qs_encode(name) + "=" + qs_encode(value)
+
+
+def encode_query_list(query_list):
+    """Encode a list of (name, value) pairs in the same way as URLObject,
+    which builds the query string up one parameter at a time"""
+    parameters = []
+    for name, value in query_list:
+        parameter = encode_query_param(name, value)
+        # Adding an empty parameter to an empty query string is a no-op
+        if parameter or parameters:
+            parameters.append(parameter)
+    return "&".join(parameters)
+
+
+class MutableURL:
+    """A URL which is modified in place, and serialised only once.
+
+    The components of the URL are split out when it is created, and each
+    modification works on those components directly rather than building a
+    new URL string, as URLObject does. The output matches that of the
+    equivalent chain of URLObject calls.
+
+    The query string is held either as its encoded string or as a list of
+    decoded (name, value) pairs, whichever the last operation left behind:
+    adding parameters to an encoded query string is a simple concatenation,
+    while removing or replacing parameters works on the list, which is only
+    encoded again when it is needed.
+    """
+
+    def __init__(self, url=""):
+        if isinstance(url, ParsedURL):
+            # Already split, so don't do it again
+            self._url = url.url
+            self._scheme, self._netloc, self._path, self._query, self._fragment = url._split
+        else:
+            url = str(url)
+            self._url = url
+            self._scheme, self._netloc, self._path, self._query, self._fragment = urlsplit(url)
+        self._query_list = None
+
+    def __str__(self):
+        if self._url is None:
+            self._url = urlunsplit((self._scheme, self._netloc, self._path, self.query, self._fragment))
+        return self._url
+
+    def __repr__(self):
+        return "MutableURL(%r)" % str(self)
+
+    def copy(self):
+        """Return an independent copy of this URL, without parsing
+        or serialising it again"""
+        url = MutableURL.__new__(MutableURL)
+        url._url = self._url
+        url._scheme, url._netloc, url._path, url._fragment = self._scheme, self._netloc, self._path, self._fragment
+        url._query = self._query
+        url._query_list = None if self._query_list is None else list(self._query_list)
+        return url
+
+    @property
+    def scheme(self):
+        return self._scheme
+
+    def set_scheme(self, scheme):
+        self._scheme = scheme
+        self._make_path_absolute()
+        self._url = None
+
+    def _make_path_absolute(self):
+        # urlunsplit() puts a slash in front of a relative path once the URL
+        # has a netloc, or a scheme which uses one, and URLObject keeps it
+        # when it parses the URL again, even if they are later removed
+        if self._path and self._path[0] != "/" and (self._netloc or (self._scheme and self._scheme in uses_netloc)):
+            self._path = "/" + self._path
+
+    @property
+    def netloc(self):
+        return self._netloc
+
+    def set_netloc(self, netloc):
+        self._netloc = netloc
+        self._make_path_absolute()
+        self._url = None
+
+    @property
+    def hostname(self):
+        return Netloc(self._netloc).hostname
+
+    def set_hostname(self, hostname):
+        self.set_netloc(Netloc(self._netloc).with_hostname(hostname))
+
+    def set_port(self, port):
+        self.set_netloc(Netloc(self._netloc).with_port(port))
+
+    def set_auth(self, *auth):
+        self.set_netloc(Netloc(self._netloc).with_auth(*auth))
+
+    @property
+    def path(self):
+        return self._path
+
+    def set_path(self, path):
+        self._path = path
+        self._make_path_absolute()
+        self._url = None
+
+    def add_path(self, partial_path):
+        self.set_path(URLPath(self._path).add(partial_path))
+
+    @property
+    def fragment(self):
+        return self._fragment
+
+    def set_fragment(self, fragment):
+        self._fragment = path_encode(fragment)
+        self._url = None
+
+    @property
+    def query(self):
+        """The encoded query string"""
+        if self._query is None:
+            self._query = encode_query_list(self._query_list)
+        return self._query
+
+    def _parsed_query(self):
+        if self._query_list is None:
+            self._query_list = QueryString(self._query).list
+        return self._query_list
+
+    @property
+    def query_list(self):
+        """The query as a list of decoded (name, value) pairs. Changes
+        made to this list are not reflected in the URL"""
+        return list(self._parsed_query())
+
+    @property
+    def query_dict(self):
+        return dict(self._parsed_query())
+
+    def set_query(self, query):
+        """Replace the query with an (encoded) query string"""
+        self._query = str(query)
+        self._query_list = None
+        self._url = None
+
+    def set_query_list(self, query_list):
+        """Replace the query with a list of decoded (name, value) pairs"""
+        query_list = list(query_list)
+        # Empty parameters at the start of the list aren't encoded, so
+        # wouldn't be there if the query string were parsed again
+        while query_list and query_list[0] == ("", None):
+            del query_list[0]
+        self._query_list = query_list
+        self._query = None
+        self._url = None
+
+    def add_query_params(self, params):
+        """Append an iterable of (name, value) pairs to the query"""
+        for name, value in params:
+            pairs = expand_query_param(name, value)
+            if self._query is None and pairs:
+                self._query_list.extend(pairs)
+            else:
+                query = self.query
+                parameter = encode_query_param(name, value)
+                self._query = query + "&" + parameter if query else parameter
+                self._query_list = None
+        self._url = None
+
+    def set_query_param(self, name, value):
+        self.set_query_params([(name, value)])
+
+    def set_query_params(self, params):
+        """Set an iterable of (name, value) pairs on the query, replacing
+        any existing parameters with the same names"""
+        to_set = {}
+        for name, value in params:
+            # Setting the same name twice moves it to the end
+            to_set.pop(name, None)
+            to_set[name] = expand_query_param(name, value)
+        if not to_set:
+            # Leave the query exactly as it is, rather than re-encoding it
+            return
+        query_list = [(name, value) for name, value in self._parsed_query() if name not in to_set]
+        for pairs in to_set.values():
+            query_list.extend(pairs)
+        self.set_query_list(query_list)
+
+    def del_query_param(self, name):
+        self.set_query_list([(n, v) for n, v in self._parsed_query() if n != name])
+
+    def del_query_params(self, names):
+        names = set(names)
+        self.set_query_list([(n, v) for n, v in self._parsed_query() if n not in names])
+
+    def del_query_param_value(self, name, value):
+        self.set_query_list([(n, v) for n, v in self._parsed_query() if n != name or v != value])
+
+    def canonicalize(self):
+        """Rewrite the URL in a canonical form, so that equivalent URLs
+        serialise identically: the scheme and hostname are lowercased,
+        percent-encoding is normalized, parameters with empty values are
+        dropped and the remaining parameters are sorted by name. The
+        values of a repeated parameter keep their order"""
+        if self._scheme != self._scheme.lower():
+            self.set_scheme(self._scheme.lower())
+        auth, at, host = self._netloc.rpartition("@")
+        if host != host.lower():
+            self.set_netloc(auth + at + host.lower())
+        path = normalize_percent_encoding(self._path)
+        if path != self._path:
+            self.set_path(path)
+        fragment = normalize_percent_encoding(self._fragment)
+        if fragment != self._fragment:
+            self._fragment = fragment
+            self._url = None
+        query_list = sorted((param for param in self._parsed_query() if param[1] != ""), key=lambda param: param[0])
+        self.set_query_list(query_list)
+
+
+class ParsedURL:
+    """A read-only URL, split into its components once.
+
+    Exposes the same components, with the same values, as URLObject does
+    for the URLs passed to spurl's ``*_from`` arguments, so the same source
+    URL can be shared between any number of them. It can also be passed
+    to ``base``, or to the ``*_from`` arguments, as it is.
+    """
+
+    __slots__ = ("url", "_split", "_query_dict")
+
+    def __init__(self, url):
+        self.url = str(url)
+        self._split = urlsplit(self.url)
+        self._query_dict = None
+
+    def __str__(self):
+        return self.url
+
+    def __repr__(self):
+        return "ParsedURL(%r)" % self.url
+
+    @property
+    def scheme(self):
+        return self._split.scheme
+
+    @property
+    def netloc(self):
+        return self._split.netloc
+
+    @property
+    def hostname(self):
+        return self._split.hostname
+
+    @property
+    def port(self):
+        return self._split.port
+
+    @property
+    def path(self):
+        return self._split.path
+
+    @property
+    def query(self):
+        return QueryString(self._split.query)
+
+    @property
+    def query_dict(self):
+        if self._query_dict is None:
+            self._query_dict = self.query.dict
+        return dict(self._query_dict)
+
+    @property
+    def fragment(self):
+        return path_decode(self._split.fragment)
+
+
+def get_parsed_url(request):
+    """Return the request's full path as a ParsedURL, parsing it only
+    the first time it is asked for"""
+    try:
+        return request.spurl_url
+    except AttributeError:
+        request.spurl_url = ParsedURL(request.get_full_path())
+        return request.spurl_url